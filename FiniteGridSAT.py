@@ -1,4 +1,7 @@
 from ortools.sat.python import cp_model
+import functools
+import numpy as np
+from numba import njit, prange
 import time  # Added to track duration
 
 # --- CONFIGURATION ---
@@ -7,84 +10,86 @@ MAX_MAX_COL_NUMBER = 88
 N = GRID_SIZE
 MIN_COL_NUMBER = 78
 MAX_TIME=250.0
+NUM_SEARCH_WORKERS = 16  # CP-SAT portfolio: generic strategies + LNS workers
+LOG_SEARCH = False  # Set True to see which workers/LNS neighborhoods fire
 
-def solve_finite_grid(MAX_COL_NUMBER):
+def solve_finite_grid(MAX_COL_NUMBER, prev_grid=None):
     print(f"\n[{time.strftime('%H:%M:%S')}] Starting setup for Max Colors: {MAX_COL_NUMBER}")
     model = cp_model.CpModel()
     
     # 1. CREATE VARIABLES
     print(f"  > Creating variables for {N}x{N} grid...")
-    grid = {}
+    # All cells share one domain object, and variables are left unnamed to
+    # keep the model proto small
+    cell_domain = cp_model.Domain(1, MAX_COL_NUMBER)
+    grid = [None] * (N * N)  # Row-major: cell (r, c) lives at r * N + c
+    b = {}
+    b_index = {}  # Proto index of b[r, c, z], used for raw constraint building
     for r in range(N):
         for c in range(N):
-            grid[r, c] = model.NewIntVar(1, MAX_COL_NUMBER, f'grid_{r}_{c}')
+            grid[r * N + c] = model.NewIntVarFromDomain(cell_domain, '')
+
+            # Channeling: b[r, c, z] is True exactly when grid[r * N + c] == z
+            cell_bools = [model.NewBoolVar('') for _ in range(MAX_COL_NUMBER)]
+            model.AddMapDomain(grid[r * N + c], cell_bools, offset=1)
+            for z, is_z in enumerate(cell_bools, start=1):
+                b[r, c, z] = is_z
+                b_index[r, c, z] = is_z.Index()
+
+    # Warm start: a solution with more colors is usually close to one with fewer
+    if prev_grid is not None:
+        print("  > Hinting solver with previous solution...")
+        for r in range(N):
+            for c in range(N):
+                if prev_grid[r][c] <= MAX_COL_NUMBER:
+                    model.AddHint(grid[r * N + c], prev_grid[r][c])
 
     # ---------------------------------------------------------
     # A. PACKING CONSTRAINTS (Finite Exclusion Zone)
     # ---------------------------------------------------------
     print("  > Building Packing Constraints...")
+    # The packing rules are pure boolean constraints, so they are appended
+    # straight onto the model proto, skipping the Python wrapper's per-call
+    # overhead.
+    proto = model.Proto()
+
     for z in range(1, MAX_COL_NUMBER + 1):
         # Progress update every 10 colors to show activity
         if z % 10 == 0 or z == MAX_COL_NUMBER:
             print(f"    ... processing color {z}/{MAX_COL_NUMBER}")
-            
-        for r in range(N):
-            for c in range(N):
-                # Switch variable: Is grid[r,c] == z?
-                b = model.NewBoolVar(f'is_{z}_{r}_{c}')
-                model.Add(grid[r, c] == z).OnlyEnforceIf(b)
-                model.Add(grid[r, c] != z).OnlyEnforceIf(b.Not())
-
-                # If 'b' is True, forbid 'z' in the exclusion zone
-                for dy in range(-z, z + 1):
-                    for dx in range(-z, z + 1):
-                        if dy == 0 and dx == 0: continue
-                        
-                        # Manhattan check
-                        if abs(dy) + abs(dx) <= z:
-                            nr, nc = r + dy, c + dx
-                            
-                            # BOUNDARY CHECK: Only apply if neighbor is inside grid
-                            if 0 <= nr < N and 0 <= nc < N:
-                                model.Add(grid[nr, nc] != z).OnlyEnforceIf(b)
 
-    # ---------------------------------------------------------
-    # B. SPECIAL RULE FOR 1s (Distance 2)
-    # ---------------------------------------------------------
-    print("  > Building Special Rule for 1s (Distance 2)...")
-    for r in range(N):
-        for c in range(N):
-            is_one = model.NewBoolVar(f'is_one_{r}_{c}')
-            model.Add(grid[r, c] == 1).OnlyEnforceIf(is_one)
-            model.Add(grid[r, c] != 1).OnlyEnforceIf(is_one.Not())
-            
-            # Check Distance 2 Diamond
-            for dy in range(-2, 3):
-                for dx in range(-2, 3):
-                    if dy == 0 and dx == 0: continue
-                    if abs(dy) + abs(dx) <= 2:
-                        nr, nc = r + dy, c + dx
-                        
-                        # BOUNDARY CHECK
-                        if 0 <= nr < N and 0 <= nc < N:
-                            model.Add(grid[nr, nc] != 1).OnlyEnforceIf(is_one)
+        # SPECIAL RULE FOR 1s: exclusion distance is 2, otherwise it is z
+        exclusion_dist = 2 if z == 1 else z
+
+        # Each clique of mutually conflicting cells can hold at most one 'z'
+        for clique in get_packing_cliques(N, exclusion_dist):
+            proto.constraints.add().at_most_one.literals.extend(
+                [b_index[r, c, z] for r, c in clique])
+
+    # Capacity bounds: redundant global counts that tighten the LP relaxation
+    for z in range(1, MAX_COL_NUMBER + 1):
+        maxCount = get_max_capacity(z, N)
+        if maxCount is None:
+            continue
+        model.Add(sum(b[r, c, z] for r in range(N) for c in range(N)) <= maxCount)
 
     # ---------------------------------------------------------
-    # C. VERTEX ADJACENCY RULES
+    # B. VERTEX ADJACENCY RULES
     # ---------------------------------------------------------
     print("  > Building Vertex Adjacency & Arithmetic Rules...")
     neighbor_offsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    sum_domain = cp_model.Domain(2, 2 * MAX_COL_NUMBER)
 
     for r in range(N):
         for c in range(N):
-            current = grid[r, c]
+            current = grid[r * N + c]
             
             # 1. Collect Valid Neighbors (Handle Corners/Edges)
             valid_neighbors = []
             for dy, dx in neighbor_offsets:
                 nr, nc = r + dy, c + dx
                 if 0 <= nr < N and 0 <= nc < N:
-                    valid_neighbors.append(grid[nr, nc])
+                    valid_neighbors.append(grid[nr * N + nc])
 
             # 2. Apply Rules to Valid Neighbors
             for neighbor in valid_neighbors:
@@ -97,20 +102,75 @@ def solve_finite_grid(MAX_COL_NUMBER):
 
             # Rule 3: Arithmetic Progression Prevention
             # "2 * Current != Neighbor1 + Neighbor2"
+            # The doubled value and each pair sum get their own variables, so
+            # the != propagator works on plain integer variables and presolve
+            # can share the repeated expressions.
+            if len(valid_neighbors) < 2: continue
+            doubled = model.NewIntVarFromDomain(sum_domain, '')
+            model.Add(doubled == 2 * current)
             for i in range(len(valid_neighbors)):
                 for j in range(i + 1, len(valid_neighbors)):
                     n1 = valid_neighbors[i]
                     n2 = valid_neighbors[j]
-                    model.Add(2 * current != n1 + n2)
+                    pair_sum = model.NewIntVarFromDomain(sum_domain, '')
+                    model.Add(pair_sum == n1 + n2)
+                    model.Add(doubled != pair_sum)
+
+    # ---------------------------------------------------------
+    # C. SYMMETRY BREAKING (Dihedral Group of the Square)
+    # ---------------------------------------------------------
+    # Every rule above is invariant under the 8 rotations/reflections of the
+    # grid, so require the row-major reading to be the lex-smallest of them.
+    # NOTE: There is no matching value symmetry to break. Each label has its
+    # own exclusion distance and takes part in the doubling/progression
+    # rules, so relabeling colors does not map solutions to solutions and a
+    # value-precedence constraint would cut off valid labelings.
+    print("  > Building Symmetry Breaking Constraints...")
+    symmetries = [
+        lambda r, c: (N - 1 - c, r),          # Rotate 90
+        lambda r, c: (N - 1 - r, N - 1 - c),  # Rotate 180
+        lambda r, c: (c, N - 1 - r),          # Rotate 270
+        lambda r, c: (r, N - 1 - c),          # Flip Horizontal
+        lambda r, c: (N - 1 - r, c),          # Flip Vertical
+        lambda r, c: (c, r),                  # Main Diagonal
+        lambda r, c: (N - 1 - c, N - 1 - r),  # Anti Diagonal
+    ]
+    for transform in symmetries:
+        transformed = []
+        for r in range(N):
+            for c in range(N):
+                tr, tc = transform(r, c)
+                transformed.append(grid[tr * N + tc])
+        # The flat grid already is the row-major reading
+        add_lex_less_or_equal(model, grid, transformed)
+
+    # ---------------------------------------------------------
+    # D. SEARCH STRATEGY
+    # ---------------------------------------------------------
+    # Corners and edges have fewer neighbors, so branch on the border cells
+    # first, then the interior, lowest label first. With the default AUTOMATIC
+    # branching CP-SAT's fixed-search worker follows this order while the
+    # other workers keep their own heuristics.
+    border_vars = []
+    interior_vars = []
+    for r in range(N):
+        for c in range(N):
+            if r in (0, N - 1) or c in (0, N - 1):
+                border_vars.append(grid[r * N + c])
+            else:
+                interior_vars.append(grid[r * N + c])
+    model.AddDecisionStrategy(border_vars, cp_model.CHOOSE_FIRST, cp_model.SELECT_MIN_VALUE)
+    if interior_vars:
+        model.AddDecisionStrategy(interior_vars, cp_model.CHOOSE_FIRST, cp_model.SELECT_MIN_VALUE)
 
     # ---------------------------------------------------------
     # SOLVE
     # ---------------------------------------------------------
     solver = cp_model.CpSolver()
-    solver.parameters.num_search_workers = 0 
+    solver.parameters.num_search_workers = NUM_SEARCH_WORKERS
     solver.parameters.random_seed = 42
     solver.parameters.max_time_in_seconds = MAX_TIME
-    solver.parameters.log_search_progress = False 
+    solver.parameters.log_search_progress = LOG_SEARCH
 
     print(f"  > Model built. Starting CP-SAT Solver (Time limit: {MAX_TIME}s)...")
     start_time = time.time()
@@ -122,79 +182,221 @@ def solve_finite_grid(MAX_COL_NUMBER):
         
         final_grid = []
         for r in range(N):
-            row = [solver.Value(grid[r, c]) for c in range(N)]
+            row = [solver.Value(grid[r * N + c]) for c in range(N)]
             final_grid.append(row)
             print(f"      {row}")
             
         verify_finite_solution(final_grid, N)
-        return True
+        return final_grid
     else:
         print(f"  >>> FAILURE: No solution found within constraints (Time: {elapsed:.2f}s).")
-        return False
+        return None
+
+@njit(cache=True)
+def group_by_label(flat):
+    """Returns (order, sorted_vals, starts): cell indices sorted by label, the
+    labels in that order, and where each label's group starts (plus the end)."""
+    # A stable sort keeps each group in row-major order
+    order = np.argsort(flat, kind='mergesort')
+    sorted_vals = flat[order]
+    num_groups = 1
+    for i in range(1, len(flat)):
+        if sorted_vals[i] != sorted_vals[i - 1]:
+            num_groups += 1
+    starts = np.empty(num_groups + 1, dtype=np.int64)
+    starts[0] = 0
+    starts[num_groups] = len(flat)
+    k = 1
+    for i in range(1, len(flat)):
+        if sorted_vals[i] != sorted_vals[i - 1]:
+            starts[k] = i
+            k += 1
+    return order, sorted_vals, starts
+
+@njit(parallel=True, cache=True)
+def find_packing_clashes(g):
+    """For each distinct label (ascending), returns (r, c, nr, nc) of the first
+    two of its cells within distance label of each other, or -1s if none."""
+    n = g.shape[0]
+    order, sorted_vals, starts = group_by_label(g.ravel())
+    num_groups = len(starts) - 1
+
+    # Only cells sharing a label can clash, so compare pairs within each
+    # group: O(sum of k^2) instead of scanning every cell's full diamond.
+    # Groups are independent and each writes its own row (prange can't break)
+    clashes = np.full((num_groups, 4), -1, dtype=np.int64)
+    for k in prange(num_groups):
+        val = sorted_vals[starts[k]]
+        for i in range(starts[k], starts[k + 1]):
+            r1, c1 = order[i] // n, order[i] % n
+            for j in range(i + 1, starts[k + 1]):
+                r2, c2 = order[j] // n, order[j] % n
+                if abs(r1 - r2) + abs(c1 - c2) <= val:
+                    clashes[k, 0] = r1
+                    clashes[k, 1] = c1
+                    clashes[k, 2] = r2
+                    clashes[k, 3] = c2
+                    break
+            if clashes[k, 0] >= 0: break
+    return clashes
 
 def verify_finite_solution(grid, N):
     print("    Running Independent Verification...", end=" ")
-    
-    for r in range(N):
-        for c in range(N):
-            val = grid[r][c]
-
-            # 1. Finite Packing Test
-            for dy in range(-val, val + 1):
-                for dx in range(-val, val + 1):
-                    if dy == 0 and dx == 0: continue
-                    
-                    if abs(dy) + abs(dx) <= val:
-                        nr, nc = r + dy, c + dx
-                        # BOUNDARY CHECK
-                        if 0 <= nr < N and 0 <= nc < N:
-                            if grid[nr][nc] == val:
-                                print(f"\n    [Verification Failed] Packing error at [{r}][{c}] vs [{nr}][{nc}] (Value: {val})")
-                                return False
-
-            # 2. Collect Finite Incident Edges
-            incident_edges = []
-            neighbor_vals = []
-            
-            # Check Up/Down/Left/Right
-            for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nr, nc = r + dy, c + dx
-                if 0 <= nr < N and 0 <= nc < N:
-                    n_val = grid[nr][nc]
-                    neighbor_vals.append(n_val)
-                    
-                    # Calculate Edge Difference
-                    diff = abs(val - n_val)
-                    incident_edges.append(diff)
-                    
-                    # Vertex Rules
-                    if diff == 0: 
-                        print(f"\n    [Verification Failed] Neighbor equal at [{r}][{c}]")
-                        return False
-                    if diff == val: 
-                        print(f"\n    [Verification Failed] Diff equals self at [{r}][{c}]")
-                        return False
-                    if diff == n_val: 
-                        print(f"\n    [Verification Failed] Diff equals neighbor at [{r}][{c}]")
-                        return False
-
-            # 3. Incident Edge Uniqueness
-            if len(set(incident_edges)) != len(incident_edges):
-                print(f"\n    [Verification Failed] Edge collision at [{r}][{c}]: {incident_edges}")
-                return False
+    g = np.array(grid, dtype=np.int64)
+
+    # 1. Finite Packing Test (compiled, one label group per thread)
+    clash = first_clash(find_packing_clashes(g))
+    if clash is not None:
+        r, c, nr, nc = clash
+        print(f"\n    [Verification Failed] Packing error at [{r}][{c}] vs [{nr}][{nc}] (Value: {g[r, c]})")
+        return False
+
+    # 2. Edge Differences (Vertical then Horizontal)
+    violation = find_vertex_rule_violation([(g[:-1, :], g[1:, :]), (g[:, :-1], g[:, 1:])])
+    if violation is not None:
+        reason, r, c = violation
+        print(f"\n    [Verification Failed] {reason} at [{r}][{c}]")
+        return False
+
+    # 3. Incident Edge Uniqueness
+    # Missing edges on the border get distinct negative placeholders
+    diff_v = np.abs(g[:-1, :] - g[1:, :])
+    diff_h = np.abs(g[:, :-1] - g[:, 1:])
+    incident = np.stack([np.full((N, N), -k) for k in range(1, 5)])
+    incident[0, 1:, :] = diff_v   # Up
+    incident[1, :-1, :] = diff_v  # Down
+    incident[2, :, 1:] = diff_h   # Left
+    incident[3, :, :-1] = diff_h  # Right
+
+    hit = find_edge_collision(incident)
+    if hit is not None:
+        r, c, incident_edges = hit
+        print(f"\n    [Verification Failed] Edge collision at [{r}][{c}]: {incident_edges}")
+        return False
 
     print("PASSED.")
     return True
 
+def find_edge_collision(incident):
+    """incident: (4, rows, cols) edge differences around each cell, with
+    distinct negative placeholders for missing edges. Returns (r, c, edges)
+    for the first cell where two incident edges are equal, or None."""
+    # At most 4 edges meet at a cell, so compare the 6 pairs directly
+    # instead of sorting (or building a set per cell)
+    collision = np.zeros(incident.shape[1:], dtype=bool)
+    for i in range(4):
+        for j in range(i + 1, 4):
+            collision |= incident[i] == incident[j]
+    if not collision.any():
+        return None
+    r, c = np.argwhere(collision)[0]
+    return r, c, [int(d) for d in incident[:, r, c] if d >= 0]
+
+def find_vertex_rule_violation(pairs):
+    """pairs: (a, b) arrays of neighbouring labels, one pair per direction.
+    Returns (reason, r, c) for the first edge whose difference is zero or
+    equals one of its endpoints, or None."""
+    for a, b in pairs:
+        diff = np.abs(a - b)
+        for bad, reason in [(diff == 0, "Neighbor equal"),
+                            (diff == a, "Diff equals self"),
+                            (diff == b, "Diff equals neighbor")]:
+            if bad.any():
+                r, c = np.argwhere(bad)[0]
+                return reason, r, c
+    return None
+
+def first_clash(clashes):
+    """Returns (r, c, nr, nc) of the first label group that clashed in a
+    find_*_clashes result, or None if every row is still -1."""
+    bad_groups = np.nonzero(clashes[:, 0] >= 0)[0]
+    if len(bad_groups) == 0:
+        return None
+    return clashes[bad_groups[0]]
+
+@functools.lru_cache(maxsize=None)
+def get_packing_cliques(grid_size, exclusion_dist):
+    """Maximal sets of cells pairwise within exclusion_dist of each other.
+
+    Only depends on the grid size and distance, so the geometry is enumerated
+    once and shared by every color and every solve_finite_grid call.
+    """
+    # In rotated coordinates u = r + c, v = r - c the Manhattan distance
+    # becomes the Chebyshev distance, so cells pairwise within distance d are
+    # exactly the cells inside a (d+1)x(d+1) window of (u, v). Windows hanging
+    # over the edge of the grid only cover a subset of an inner window, so
+    # they are skipped.
+    max_uv = 2 * (grid_size - 1)  # Spread of both u and v over the grid
+    w = min(exclusion_dist, max_uv)
+    cliques = []
+    seen = set()
+    for u0 in range(0, max_uv - w + 1):
+        for v0 in range(-(grid_size - 1), grid_size - 1 - w + 1):
+            clique = []
+            for u in range(u0, u0 + w + 1):
+                for v in range(v0, v0 + w + 1):
+                    if (u + v) % 2: continue
+                    r, c = (u + v) // 2, (u - v) // 2
+                    # BOUNDARY CHECK: Only keep cells inside the grid
+                    if 0 <= r < grid_size and 0 <= c < grid_size:
+                        clique.append((r, c))
+            clique = tuple(clique)
+            if len(clique) > 1 and clique not in seen:
+                seen.add(clique)
+                cliques.append(clique)
+    return tuple(cliques)
+
+def get_max_capacity(z, grid_size):
+    """Upper bound on how many cells of a finite grid can hold label z."""
+    exclusion_dist = 2 if z == 1 else z
+    if exclusion_dist >= 2 * (grid_size - 1):
+        return None  # A single packing clique already covers the whole grid
+
+    # Tile the rotated (u, v) plane with disjoint (d+1)x(d+1) windows. Every
+    # window is a packing clique, so each one holds at most one 'z'. The
+    # tiling is shifted along the diagonal to find the fewest tiles.
+    span = exclusion_dist + 1
+    best = None
+    for shift in range(span):
+        tiles = set()
+        for r in range(grid_size):
+            for c in range(grid_size):
+                tiles.add(((r + c + shift) // span, (r - c + grid_size - 1 + shift) // span))
+        if best is None or len(tiles) < best:
+            best = len(tiles)
+    return best
+
+def add_lex_less_or_equal(model, xs, ys):
+    """Constrains the sequence xs to be lexicographically <= ys."""
+    prefix_equal = None  # True while xs[:i] == ys[:i]
+    for i in range(len(xs)):
+        x, y = xs[i], ys[i]
+        if x is y: continue  # Fixed point of the symmetry, always equal
+
+        ct = model.Add(x <= y)
+        if prefix_equal is not None:
+            ct.OnlyEnforceIf(prefix_equal)
+
+        # The prefix may only stop being equal where x < y
+        next_equal = model.NewBoolVar('')
+        ct = model.Add(x < y)
+        ct.OnlyEnforceIf(next_equal.Not())
+        if prefix_equal is not None:
+            ct.OnlyEnforceIf(prefix_equal)
+        prefix_equal = next_equal
+
 if __name__ == "__main__":
     print("=== Finite Grid SAT Solver ===")
     print(f"Grid Size: {GRID_SIZE}x{GRID_SIZE}")
     print(f"Testing Max Colors from {MAX_MAX_COL_NUMBER} down to {MIN_COL_NUMBER}")
     
     solved = True
+    prev_grid = None
     for i in range(MAX_MAX_COL_NUMBER, MIN_COL_NUMBER, -1):
-        # Pass the current Max Color to the solver
-        if not solve_finite_grid(i):
+        # Pass the current Max Color (and the last solution as hints) to the solver
+        final_grid = solve_finite_grid(i, prev_grid)
+        if final_grid is None:
             print(f"\n!!! Stopping: Could not solve for {i} colors. (Previous {i+1} was likely the minimum) !!!")
             solved = False
-            break
\ No newline at end of file
+            break
+        prev_grid = final_grid
\ No newline at end of file
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import njit
 
 GRID_SIZE = 100
 MAX_COL_NUMBER = 100 
@@ -7,7 +8,7 @@ TOTAL_CELLS = GRID_SIZE * GRID_SIZE
 def solve_finite_grid():
     for colNum in range(1, MAX_COL_NUMBER + 1):
         print(f"Testing for max label: {colNum}...")
-        grid = np.zeros(TOTAL_CELLS, dtype=int)
+        grid = np.zeros(TOTAL_CELLS, dtype=np.int32)
         
         # Start search from the first cell (No symmetry restrictions)
         if backtrack(grid, 0, colNum):
@@ -17,24 +18,46 @@ def solve_finite_grid():
 
     print("Unable to find a valid labeling for this finite grid.")
 
+@njit(cache=True)
 def backtrack(grid, idx, max_col):
-    if idx == TOTAL_CELLS:
-        return True 
+    # Iterative depth-first search from cell idx onwards.
+    # next_val[i] remembers the next label still to be tried at cell i.
+    start_idx = idx
+    next_val = np.ones(TOTAL_CELLS, dtype=np.int32)
 
-    r, c = divmod(idx, GRID_SIZE)
+    while idx < TOTAL_CELLS:
+        r = idx // GRID_SIZE
+        c = idx - r * GRID_SIZE
 
-    for val in range(1, max_col + 1):
-        grid[idx] = val
-        
-        # Validates both vertex and edge-difference rules
-        if is_locally_valid_finite(grid, r, c, val):
-            if backtrack(grid, idx + 1, max_col):
-                return True
-                
-        grid[idx] = 0
+        placed = False
+        while next_val[idx] <= max_col:
+            val = next_val[idx]
+            next_val[idx] += 1
+            grid[idx] = val
+
+            # Validates both vertex and edge-difference rules
+            if is_locally_valid_finite(grid, r, c, val):
+                placed = True
+                break
+
+            grid[idx] = 0
 
-    return False
+        if placed:
+            # Move forward, starting the next cell from the smallest label
+            idx += 1
+            if idx < TOTAL_CELLS:
+                next_val[idx] = 1
+        else:
+            # No label fits this cell: clear it and resume the previous one
+            grid[idx] = 0
+            next_val[idx] = 1
+            idx -= 1
+            if idx < start_idx:
+                return False
+
+    return True
 
+@njit(cache=True)
 def is_locally_valid_finite(grid_1d, r, c, val):
     # --- 1. Packing Constraint (Manhattan Distance) ---
     for x in range(val + 1):
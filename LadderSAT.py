@@ -1,96 +1,307 @@
 from ortools.sat.python import cp_model
+from FiniteGridSAT import (add_lex_less_or_equal, find_edge_collision, find_vertex_rule_violation,
+                           first_clash, group_by_label)
+import functools
+import hashlib
+import inspect
+import multiprocessing
+import numpy as np
+from numba import njit, prange
+import os
+import queue
+import tempfile
 import time
 # --- CONFIGURATION ---
 MIN_WIDTH = 45        # Start checking at this width
 MAX_WIDTH = 128        # End checking at this width (inclusive)
 MAX_COLOR = 49       # The available palette 
 HEIGHT = 4            # Fixed height for the ladder
+MAX_TIME = 180.0      # Per-width CP-SAT budget; widths that hit it are reported as timeouts
+NUM_WIDTH_PROCESSES = max(1, (os.cpu_count() or 8) // 4)  # Widths solved side by side
+NUM_SEARCH_WORKERS = max(1, (os.cpu_count() or 8) // NUM_WIDTH_PROCESSES)  # CP-SAT workers per width
+LOG_SEARCH = False    # Set True to see which CP-SAT worker finds the solution
+CACHE_MODELS = False  # Reuse built models from MODEL_CACHE_DIR (tens of MB per width on disk)
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+def get_usable_colors(width, max_color):
+    """Colors that fit on the cylinder: a color whose exclusion zone reaches
+    around it would clash with itself, so it can never appear at this width."""
+    return [z for z in range(1, max_color + 1) if (2 if z == 1 else z) < width]
+
+def get_ladder_model(width, max_color):
+    """Returns (model, grid). With CACHE_MODELS on, reloads the model from
+    MODEL_CACHE_DIR if this shape was built before, since the model only
+    depends on the shape and palette."""
+    if not CACHE_MODELS:
+        return build_ladder_model(width, max_color)
+
+    # Key on the source of everything that shapes the model, so editing any
+    # of it invalidates the cache without a manual version bump
+    source = "".join(inspect.getsource(fn) for fn in (
+        build_ladder_model, get_block_cliques, get_usable_colors, add_lex_less_or_equal))
+    key = hashlib.sha1(f"{HEIGHT}_{width}_{max_color}_{source}".encode()).hexdigest()
+    path = os.path.join(MODEL_CACHE_DIR, f"{key}.pb.txt")
+    checksum_path = path + ".sha1"
+
+    # The Python API only round-trips the text format. A file that is
+    # missing its checksum or doesn't match it (e.g. cut short by a killed
+    # run) is rebuilt rather than trusted.
+    text = None
+    if os.path.exists(path) and os.path.exists(checksum_path):
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(checksum_path) as f:
+            if hashlib.sha1(data).hexdigest() == f.read().strip():
+                text = data.decode()
+
+    if text is None:
+        model, grid = build_ladder_model(width, max_color)
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        # Write under a temporary name and move it into place, so a reader
+        # never sees a half-written file (ExportToFile picks the text format
+        # from the .txt suffix)
+        fd, tmp_path = tempfile.mkstemp(dir=MODEL_CACHE_DIR, suffix=".pb.txt")
+        os.close(fd)
+        model.ExportToFile(tmp_path)
+        with open(tmp_path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        os.replace(tmp_path, path)
+        fd, tmp_path = tempfile.mkstemp(dir=MODEL_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(digest)
+        os.replace(tmp_path, checksum_path)
+        return model, grid
 
-def solve_ladder_cylinder(width, max_color):
-    """
-    Solves the T-coloring problem for a 2 x Width grid.
-    Topology: Cylinder (Wraps horizontally, hard edges vertically).
-    """
     model = cp_model.CpModel()
-    start_time= time.time()
+    model.Proto().parse_text_format(text)
+
+    # Recover the cell variables by name
+    cell_index = {var.name: i for i, var in enumerate(model.Proto().variables)
+                  if var.name.startswith('cell_')}
+    grid = [model.GetIntVarFromProtoIndex(cell_index[f'cell_{r}_{c}'])
+            for r in range(HEIGHT) for c in range(width)]
+    return model, grid
+
+def build_ladder_model(width, max_color):
+    """Builds the cylinder model from scratch. Returns (model, grid)."""
+    model = cp_model.CpModel()
     # 1. CREATE VARIABLES
-    grid = {}
+    cell_domain = cp_model.Domain.FromValues(get_usable_colors(width, max_color))
+
+    # Flat row-major list: cell (r, c) lives at grid[r * width + c]
+    grid = []
+    ind = {}
     for r in range(HEIGHT):
         for c in range(width):
-            grid[r, c] = model.NewIntVar(1, max_color, f'cell_{r}_{c}')
+            grid.append(model.NewIntVarFromDomain(cell_domain, f'cell_{r}_{c}'))
+
+            # Channeling: ind[r, c, z] is True exactly when this cell == z
+            bools = [model.NewBoolVar(f'ind_{r}_{c}_{z}') for z in range(1, max_color + 1)]
+            model.AddMapDomain(grid[-1], bools, offset=1)
+            for z, is_z in enumerate(bools, start=1):
+                ind[r, c, z] = is_z
 
     # Helper: Handle Cylinder Topology
     def get_var(r, c):
         if 0 <= r < HEIGHT:
-            return grid[r, c % width] # Horizontal Wrap
+            return grid[r * width + c % width] # Horizontal Wrap
         return None # Vertical Hard Edge
 
     # 2. APPLY CONSTRAINTS
+    # --- A. PACKING CONSTRAINTS (Exclusion Zone) ---
+    for z in range(1, max_color + 1):
+        # SPECIAL RULE RE-ADDED: 
+        # If z=1, exclusion distance is 2. Otherwise, exclusion is z.
+        exclusion_dist = 2 if z == 1 else z
+
+        # Already excluded from the cell domain
+        if exclusion_dist >= width:
+            continue
+
+        # Each block of mutually conflicting cells can hold at most one 'z'
+        for cells in get_block_cliques(HEIGHT, width, exclusion_dist):
+            model.AddAtMostOne([ind[r, c, z] for r, c in cells])
+
+    # --- B. ADJACENCY & ARITHMETIC RULES ---
+    # Each edge once: rightward (wrapping) and downward (hard bottom edge)
+    edges = [(r * width + c, r * width + (c + 1) % width) for r in range(HEIGHT) for c in range(width)]
+    edges += [(r * width + c, (r + 1) * width + c) for r in range(HEIGHT - 1) for c in range(width)]
+
+    for a, b in edges:
+        # Rule 1: Neighbors cannot be equal
+        model.Add(grid[a] != grid[b])
+
+        # Rule 2: No Doubling (in either direction)
+        model.Add(grid[a] != 2 * grid[b])
+        model.Add(grid[b] != 2 * grid[a])
+
+    # Rule 3: Arithmetic Progression Prevention
+    # (A, B, C) -> 2*B != A + C, one constraint per center and neighbor pair
     for r in range(HEIGHT):
         for c in range(width):
-            current = grid[r, c]
-            
-            # --- A. PACKING CONSTRAINTS (Exclusion Zone) ---
-            for z in range(1, max_color + 1):
-                # SPECIAL RULE RE-ADDED: 
-                # If z=1, exclusion distance is 2. Otherwise, exclusion is z.
-                exclusion_dist = 2 if z == 1 else z
-                
-                # Switch: True if this cell == z
-                is_z = model.NewBoolVar(f'is_val_{z}_{r}_{c}')
-                model.Add(current == z).OnlyEnforceIf(is_z)
-                model.Add(current != z).OnlyEnforceIf(is_z.Not())
-
-                # Enforce exclusion zone
-                for dy in range(-exclusion_dist, exclusion_dist + 1):
-                    for dx in range(-exclusion_dist, exclusion_dist + 1):
-                        if dy == 0 and dx == 0: continue
-                        
-                        if abs(dy) + abs(dx) <= exclusion_dist:
-                            neighbor = get_var(r + dy, c + dx)
-                            
-                            # Explicit check for None (Vertical edges)
-                            if neighbor is not None:
-                                model.Add(neighbor != z).OnlyEnforceIf(is_z)
-
-            # --- B. ADJACENCY & ARITHMETIC RULES ---
-            potential_offsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            current = grid[r * width + c]
             neighbors = []
-            for dy, dx in potential_offsets:
+            for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
                 n_var = get_var(r + dy, c + dx)
                 if n_var is not None:
                     neighbors.append(n_var)
 
-            for n in neighbors:
-                # Rule 1: Neighbors cannot be equal
-                model.Add(n != current)
-                
-                # Rule 2: No Doubling (Neighbor != 2*Current)
-                model.Add(n != 2 * current)
-                model.Add(current != 2 * n)
-
-            # Rule 3: Arithmetic Progression Prevention
-            # (A, B, C) -> 2*B != A + C
             for i in range(len(neighbors)):
                 for j in range(i + 1, len(neighbors)):
                     model.Add(2 * current != neighbors[i] + neighbors[j])
+    # --- C. SYMMETRY BREAKING ---
+    # The rules are invariant under rotating the cylinder and flipping it
+    # upside down. Both constraints below are prefixes of "the row-major
+    # reading is lex-smallest in its orbit", so together they stay sound.
+    top_row = grid[:width]
+    for k in range(1, width):
+        add_lex_less_or_equal(model, top_row, top_row[k:] + top_row[:k])
+    model.Add(grid[0] <= grid[(HEIGHT - 1) * width])
+
+    return model, grid
+
+def solve_ladder_cylinder(width, max_color):
+    """
+    Solves the T-coloring problem for a HEIGHT x Width grid.
+    Topology: Cylinder (Wraps horizontally, hard edges vertically).
+    Returns ("SOLVED", solver, grid), ("INFEASIBLE", None, None) when proven
+    impossible, or ("FAILED", None, None) when the time budget ran out.
+    """
+    start_time= time.time()
+    if not get_usable_colors(width, max_color):
+        return "INFEASIBLE", None, None
+    model, grid = get_ladder_model(width, max_color)
+
     elapsed=time.time()-start_time
-    print(elapsed)
+    print(f"[Width {width}] Model ready in {elapsed:.2f}s")
     # 3. SOLVE
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 180.0 
-    solver.parameters.num_search_workers = 0 
+    solver.parameters.max_time_in_seconds = MAX_TIME
+    solver.parameters.num_search_workers = NUM_SEARCH_WORKERS
     solver.parameters.random_seed = 42
-    solver.parameters.log_search_progress = False
+    solver.parameters.log_search_progress = LOG_SEARCH
+    # Pure feasibility model: no objective, so the LP relaxation doesn't pay off
+    solver.parameters.linearization_level = 0
     start_time=time.time()
     status = solver.Solve(model)
-    print(time.time()-start_time)
+    print(f"[Width {width}] Solver finished in {time.time()-start_time:.2f}s")
 
+    # No objective, so CP-SAT already returns on the first feasible solution
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         return "SOLVED", solver, grid
+    elif status == cp_model.INFEASIBLE:
+        return "INFEASIBLE", None, None
     else:
         return "FAILED", None, None
-    
+
+def solve_width(width, max_color):
+    """Process-pool entry point: solver objects can't be pickled, so hand
+    back (status, rows) with rows None unless solved."""
+    result_status, solver, grid = solve_ladder_cylinder(width, max_color)
+    if result_status != "SOLVED":
+        return result_status, None
+    return result_status, [[solver.Value(grid[r * width + c]) for c in range(width)] for r in range(HEIGHT)]
+
+@njit(parallel=True, cache=True)
+def find_cylinder_clashes(g):
+    """For each distinct label (ascending), returns (r, c, nr, nc) of the first
+    two of its cells within its exclusion distance on the cylinder, or -1s."""
+    # Same per-label pair scan as find_packing_clashes in FiniteGridSAT.py;
+    # only the distance differs, since columns wrap around the cylinder
+    height, width = g.shape
+    order, sorted_vals, starts = group_by_label(g.ravel())
+    num_groups = len(starts) - 1
+    clashes = np.full((num_groups, 4), -1, dtype=np.int64)
+    for k in prange(num_groups):
+        val = sorted_vals[starts[k]]
+        exclusion_dist = 2 if val == 1 else val
+        for i in range(starts[k], starts[k + 1]):
+            r1, c1 = order[i] // width, order[i] % width
+            for j in range(i + 1, starts[k + 1]):
+                r2, c2 = order[j] // width, order[j] % width
+                dc = abs(c1 - c2)
+                if abs(r1 - r2) + min(dc, width - dc) <= exclusion_dist:
+                    clashes[k, 0] = r1
+                    clashes[k, 1] = c1
+                    clashes[k, 2] = r2
+                    clashes[k, 3] = c2
+                    break
+            if clashes[k, 0] >= 0: break
+    return clashes
+
+def verify_solution(rows):
+    """Independently checks a solved cylinder (rows wrap, columns don't)."""
+    print("Running Independent Verification...", end=" ")
+    g = np.array(rows, dtype=np.int64)
+    height, width = g.shape
+
+    # 1. Packing Test (compiled, one label group per thread)
+    too_wide = (g >= width) | ((g == 1) & (width <= 2))
+    if too_wide.any():
+        r, c = np.argwhere(too_wide)[0]
+        print(f"\n[Verification Failed] Value {g[r, c]} at [{r}][{c}] wraps into its own zone")
+        return False
+    clash = first_clash(find_cylinder_clashes(g))
+    if clash is not None:
+        r, c, nr, nc = clash
+        print(f"\n[Verification Failed] Packing error at [{r}][{c}] vs [{nr}][{nc}] (Value: {g[r, c]})")
+        return False
+
+    # 2. Edge Differences (Vertical then Horizontal with wrap)
+    diff_v = np.abs(g[:-1, :] - g[1:, :])
+    right = np.roll(g, -1, axis=1)
+    diff_h = np.abs(g - right)
+    violation = find_vertex_rule_violation([(g[:-1, :], g[1:, :]), (g, right)])
+    if violation is not None:
+        reason, r, c = violation
+        print(f"\n[Verification Failed] {reason} at [{r}][{c}]")
+        return False
+
+    # 3. Incident Edge Uniqueness (equivalent to the AP rule once packing
+    # rules out equal neighbors). Missing edges on the top and bottom rows
+    # get distinct negative placeholders.
+    incident = np.stack([np.full((height, width), -k) for k in range(1, 5)])
+    incident[0, 1:, :] = diff_v                      # Up
+    incident[1, :-1, :] = diff_v                     # Down
+    incident[2] = np.roll(diff_h, 1, axis=1)         # Left
+    incident[3] = diff_h                             # Right
+
+    hit = find_edge_collision(incident)
+    if hit is not None:
+        r, c, incident_edges = hit
+        print(f"\n[Verification Failed] Edge collision at [{r}][{c}]: {incident_edges}")
+        return False
+
+    print("PASSED.")
+    return True
+
+@functools.lru_cache(maxsize=None)
+def get_block_cliques(height, width, exclusion_dist):
+    """Exclusion-zone cliques of a height x width cylinder: blocks that wrap
+    around the columns but stop at the top and bottom rows."""
+    # Any h x (exclusion_dist - h + 2) block of cells is pairwise within
+    # exclusion_dist (before wrapping, and wrapping only shortens
+    # distances). Every conflicting pair lies in one of these blocks with
+    # h = row gap + 1.
+    # The farthest two cells can be is the full height plus half the way
+    # around; once the zone reaches that, every pair conflicts and the
+    # whole cylinder is a single clique.
+    if exclusion_dist >= (height - 1) + width // 2:
+        return [tuple((r, c) for r in range(height) for c in range(width))]
+
+    cliques = []
+    seen = set()
+    for h in range(1, min(height, exclusion_dist + 1) + 1):
+        span = exclusion_dist - h + 2
+        for r0 in range(height - h + 1):
+            for c0 in range(width):
+                cells = tuple(sorted({(r, (c0 + dc) % width)
+                                      for r in range(r0, r0 + h) for dc in range(span)}))
+                if len(cells) > 1 and cells not in seen:
+                    seen.add(cells)
+                    cliques.append(cells)
+    return cliques
+
 def main():
     print(f"--- STARTING SEARCH ---")
     print(f"Height: {HEIGHT} (Fixed)")
@@ -98,28 +309,63 @@ def main():
     print(f"Max Color: {MAX_COLOR}")
     print("-" * 30)
 
-    # Loop through the requested widths
-    for w in range(MIN_WIDTH, MAX_WIDTH + 1):
-        print(f"Testing Width {w}...", end=" ", flush=True)
-        
-        result_status, solver, grid = solve_ladder_cylinder(w, MAX_COLOR)
-        
-        if result_status == "SOLVED":
-            print(f"SUCCESS!")
-            print(f"\n--- SOLUTION FOUND (Width {w}) ---")
-            
-            # Print the full grid for the successful width
-            for r in range(HEIGHT):
-                # Extract the row values
-                row_values = [solver.Value(grid[r, c]) for c in range(w)]
-                print(row_values)
-            
-            print("\nStopping search as requested.")
-            break  # <--- This stops the loop immediately!
-            
-        else:
-            print(f"NO SOLUTION (or Timeout)")
+    # Widths are independent, so solve several at once, handing out the next
+    # width only as a process frees up. The answer is the smallest solved
+    # width: once one solves nothing new is started, and as soon as every
+    # smaller width has settled the pool is terminated, killing any larger
+    # widths still running.
+    best_w, best_rows = None, None
+    results = queue.Queue()
+    widths = iter(range(MIN_WIDTH, MAX_WIDTH + 1))
+    running = set()
+    with multiprocessing.Pool(NUM_WIDTH_PROCESSES) as pool:  # __exit__ terminates
+        def submit_next():
+            w = next(widths, None)
+            if w is None:
+                return
+            running.add(w)
+            pool.apply_async(solve_width, (w, MAX_COLOR),
+                             callback=lambda res, w=w: results.put((w, res)),
+                             error_callback=lambda err, w=w: results.put((w, err)))
+
+        for _ in range(NUM_WIDTH_PROCESSES):
+            submit_next()
+
+        while running:
+            w, res = results.get()
+            running.discard(w)
+            if isinstance(res, BaseException):
+                raise res
+            result_status, rows = res
+            if result_status == "INFEASIBLE":
+                print(f"Width {w}: NO SOLUTION")
+            elif result_status == "FAILED":
+                print(f"Width {w}: TIMEOUT after {MAX_TIME:.0f}s (undecided)")
+            else:
+                print(f"Width {w}: SUCCESS!")
+                if best_w is None or w < best_w:
+                    best_w, best_rows = w, rows
+
+            if best_w is None:
+                submit_next()
+            elif all(rw > best_w for rw in running):
+                break
+
+    if best_w is None:
+        print("No width in range could be solved.")
+        return
+
+    for row_values in best_rows:
+        print(row_values)
+    if not verify_solution(best_rows):
+        print(f"\n!!! Width {best_w} came back SOLVED but fails verification; not reporting it. !!!")
+        if CACHE_MODELS:
+            print(f"!!! Clear {MODEL_CACHE_DIR} and rerun. !!!")
+        return
+    print(f"\n--- SOLUTION FOUND (Width {best_w}) ---")
+    print("\nStopping search as requested.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Good practice for Windows
     main()
 
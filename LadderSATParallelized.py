@@ -1,5 +1,10 @@
+import functools
 import multiprocessing
+import queue
+import threading
 from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numba import njit
 from ortools.sat.python import cp_model
 import time
 
@@ -9,10 +14,20 @@ MAX_WIDTH: int = 40
 MAX_COLOR: int = 11
 HEIGHT: int = 2
 TIME: int = 180
+NATIVE_NODE_LIMIT: int = 50_000_000  # Backtracker budget before it drops out of the race
+NATIVE_MAX_LABEL: int = 62  # Largest label the backtracker's int64 bitmasks can hold
 
 def get_flat_idx(r, c, width):
     return r * width + c
 
+@functools.lru_cache(maxsize=None)
+def get_diamond_offsets(max_dist):
+    """(dy, dx, dist) for every nonzero offset within Manhattan distance max_dist."""
+    return tuple((dy, dx, abs(dy) + abs(dx))
+                 for dy in range(-max_dist, max_dist + 1)
+                 for dx in range(-max_dist, max_dist + 1)
+                 if (dy, dx) != (0, 0) and abs(dy) + abs(dx) <= max_dist)
+
 # --- WORKER FUNCTION ---
 def generate_constraints_for_chunk(chunk_rows, width, HEIGHT, max_color):
     """
@@ -30,43 +45,40 @@ def generate_constraints_for_chunk(chunk_rows, width, HEIGHT, max_color):
     # map: z -> exclusion_distance
     z_dist_map = {z: (2 if z == 1 else z) for z in range(1, max_color + 1)}
 
+    # Optimization: We limit the scan to the max possible exclusion distance.
+    # A color 'z' is forbidden at a distance if its required buffer >= that
+    # distance, which only depends on the distance, so tabulate it once.
+    max_dist: int = int(max_color) # Worst case
+    forbidden_by_dist = {dist: [z for z, req_dist in z_dist_map.items() if req_dist >= dist]
+                         for dist in range(1, max_dist + 1)}
+    diamond = get_diamond_offsets(max_dist)
+
     for r in chunk_rows:
         for c in range(width):
             curr_idx = get_flat_idx(r, c, width)
             
             # --- 1. EXCLUSION ZONE (The Heavy Lifter) ---
-            # We scan the "neighborhood" of this cell.
-            # Optimization: We limit the scan to the max possible exclusion distance
-            # but we ONLY yield if neighbor_idx > curr_idx to avoid duplicates.
-            max_dist: int = int(max_color) # Worst case
-            
-            # We scan a square area relative to current cell
-            # This is raw geometric logic, not solver logic.
-            for dy in range(-max_dist, max_dist + 1):
-                for dx in range(-max_dist, max_dist + 1):
-                    if dy == 0 and dx == 0: continue
-                    
-                    dist = abs(dy) + abs(dx)
-                    if dist > max_dist: continue
-
-                    # Cylinder Wrap Logic
-                    nr, nc = r + dy, (c + dx) % width
-                    
-                    # Vertical Hard Edge Check
-                    if not (0 <= nr < HEIGHT): continue
-                    
-                    n_idx = get_flat_idx(nr, nc, width)
-                    
-                    # DEDUPLICATION: Only process if neighbor is "ahead" in index
-                    # This cuts work in half and prevents double-constraints.
-                    if n_idx <= curr_idx: continue
-
-                    # Find which colors are forbidden for this specific distance
-                    # A color 'z' is forbidden if its required buffer >= current distance
-                    forbidden_z = [z for z, req_dist in z_dist_map.items() if req_dist >= dist]
-                    
-                    if forbidden_z:
-                        exclusion_packets.append((curr_idx, n_idx, forbidden_z))
+            # We scan the diamond around this cell (raw geometric logic, not
+            # solver logic), but we ONLY yield if neighbor_idx > curr_idx to
+            # avoid duplicates.
+            for dy, dx, dist in diamond:
+                # Cylinder Wrap Logic
+                nr, nc = r + dy, (c + dx) % width
+                
+                # Vertical Hard Edge Check
+                if not (0 <= nr < HEIGHT): continue
+                
+                n_idx = get_flat_idx(nr, nc, width)
+                
+                # DEDUPLICATION: Only process if neighbor is "ahead" in index
+                # This cuts work in half and prevents double-constraints.
+                if n_idx <= curr_idx: continue
+
+                # Find which colors are forbidden for this specific distance
+                forbidden_z = forbidden_by_dist[dist]
+                
+                if forbidden_z:
+                    exclusion_packets.append((curr_idx, n_idx, forbidden_z))
 
             # --- 2. ADJACENCY & ARITHMETIC ---
             # Standard immediate neighbors (Up, Down, Left, Right)
@@ -94,7 +106,13 @@ def generate_constraints_for_chunk(chunk_rows, width, HEIGHT, max_color):
 
     return (exclusion_packets, adjacency_packets, arithmetic_packets)
 
-def solve_ladder_cylinder_parallel(width, max_color, time_limit):
+def solve_ladder_cylinder_parallel(width, max_color, time_limit, native_results=None):
+    """
+    Builds and solves the cylinder with CP-SAT. If native_results (a queue fed
+    by native_worker) is given, the search is stopped as soon as the
+    backtracker settles the width. Returns (status, solver, grid, native)
+    where native is the backtracker's (status, rows) if it won, else None.
+    """
     model = cp_model.CpModel()
     start_time = time.time()
     max_color= min(max_color, width-1)
@@ -161,11 +179,163 @@ def solve_ladder_cylinder_parallel(width, max_color, time_limit):
     solver.parameters.num_search_workers = 0 
     solver.parameters.random_seed = 42
     solver.parameters.log_search_progress = False
+
+    # Race the backtracker: a watcher thread stops CP-SAT once it has an
+    # answer (re-issuing the stop, in case it landed before Solve started)
+    native = [None]
+    solve_done = threading.Event()
+    def watch_native():
+        while not solve_done.is_set():
+            if native[0] is None:
+                try:
+                    native_status, rows = native_results.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if native_status == -1:
+                    return  # Out of budget: CP-SAT carries on alone
+                native[0] = (native_status, rows)
+            solver.StopSearch()
+            solve_done.wait(0.1)
+
+    watcher = None
+    if native_results is not None:
+        watcher = threading.Thread(target=watch_native, daemon=True)
+        watcher.start()
+
     start_time=time.time()
     status = solver.Solve(model)
+    solve_done.set()
+    if watcher is not None:
+        watcher.join()
     print(time.time()-start_time)
     
-    return status, solver, grid
+    return status, solver, grid, native[0]
+
+# --- NATIVE BACKTRACKER ---
+@njit(cache=True)
+def backtrack_cylinder(height, width, max_color, node_limit, out):
+    """
+    Column-by-column DFS with one bitmask domain per cell (bit z = label z
+    still allowed). Returns 1 and fills out (flat, row-major) on success,
+    0 if the width is infeasible, -1 if node_limit ran out first.
+    """
+    n = height * width
+    # Search order: column by column, top to bottom
+    order = np.empty(n, dtype=np.int64)
+    for c in range(width):
+        for r in range(height):
+            order[c * height + r] = r * width + c
+
+    # Cylinder distances and neighbor lists (-1 = hard edge)
+    dist = np.empty((n, n), dtype=np.int64)
+    for i in range(n):
+        for j in range(n):
+            dc = abs(i % width - j % width)
+            dist[i, j] = abs(i // width - j // width) + min(dc, width - dc)
+    nbr = np.full((n, 4), -1, dtype=np.int64)
+    for i in range(n):
+        r, c = i // width, i % width
+        if r > 0: nbr[i, 0] = i - width
+        if r < height - 1: nbr[i, 1] = i + width
+        nbr[i, 2] = r * width + (c - 1) % width
+        nbr[i, 3] = r * width + (c + 1) % width
+
+    # A label whose zone reaches around the cylinder can't be used at all
+    full = 0
+    for z in range(1, max_color + 1):
+        if (2 if z == 1 else z) < width:
+            full |= 1 << z
+
+    # dom[d] is the state of every domain before placing the d-th cell
+    dom = np.empty((n + 1, n), dtype=np.int64)
+    dom[0, :] = full
+    val = np.zeros(n, dtype=np.int64)
+    next_val = np.ones(n + 1, dtype=np.int64)
+
+    depth = 0
+    nodes = 0
+    while depth < n:
+        i = order[depth]
+        placed = False
+        while next_val[depth] <= max_color:
+            v = next_val[depth]
+            next_val[depth] += 1
+            if not (dom[depth, i] >> v) & 1:
+                continue
+            nodes += 1
+            if nodes > node_limit:
+                return -1
+
+            # AP rule, checked once all three cells of a triple are placed
+            ok = True
+            for a in range(4):
+                na = nbr[i, a]
+                if na < 0: continue
+                # As the middle of the triple
+                for b in range(a + 1, 4):
+                    nb = nbr[i, b]
+                    if nb >= 0 and val[na] and val[nb] and 2 * v == val[na] + val[nb]:
+                        ok = False
+                # As an end, with an already-placed middle
+                if val[na]:
+                    for b in range(4):
+                        other = nbr[na, b]
+                        if other >= 0 and other != i and val[other] and 2 * val[na] == v + val[other]:
+                            ok = False
+            if not ok:
+                continue
+
+            # Propagate: no other v within its zone, no v / 2v / v/2 next door
+            dom[depth + 1, :] = dom[depth, :]
+            exclusion_dist = 2 if v == 1 else v
+            for j in range(n):
+                if j != i and dist[i, j] <= exclusion_dist:
+                    dom[depth + 1, j] &= ~(1 << v)
+            for a in range(4):
+                na = nbr[i, a]
+                if na < 0: continue
+                if 2 * v <= max_color:
+                    dom[depth + 1, na] &= ~(1 << (2 * v))
+                if v % 2 == 0:
+                    dom[depth + 1, na] &= ~(1 << (v // 2))
+            val[i] = v
+            placed = True
+            break
+
+        if placed:
+            depth += 1
+            next_val[depth] = 1
+        else:
+            # Domain exhausted: pop a level. dom[depth] still holds that
+            # level's domains, so only its placed value needs undoing
+            next_val[depth] = 1
+            depth -= 1
+            if depth < 0:
+                return 0
+            val[order[depth]] = 0
+
+    for i in range(n):
+        out[i] = val[i]
+    return 1
+
+def solve_native(width, max_color, node_limit=NATIVE_NODE_LIMIT):
+    """Runs the bitmask backtracker. Returns (status, rows) with status 1
+    (solved), 0 (infeasible) or -1 (budget exhausted or palette too large
+    for the masks; rows is None)."""
+    max_label = min(max_color, width - 1)
+    # Domains are int64 masks with bit z for label z, so labels past 62
+    # would overflow into the sign bit; leave those widths to CP-SAT
+    if max_label > NATIVE_MAX_LABEL:
+        return -1, None
+    out = np.zeros(HEIGHT * width, dtype=np.int64)
+    status = backtrack_cylinder(HEIGHT, width, max_label, node_limit, out)
+    if status != 1:
+        return status, None
+    return status, out.reshape(HEIGHT, width).tolist()
+
+def native_worker(width, max_color, node_limit, results):
+    """Process entry point for the backtracker's side of the race."""
+    results.put(solve_native(width, max_color, node_limit))
 
 def main():
     print(f"--- STARTING SEARCH ---")
@@ -175,7 +345,17 @@ def main():
 
     for w in range(MIN_WIDTH, MAX_WIDTH + 1):
         print(f"Testing Width {w}...", end=" ", flush=True)
-        result_status, solver, grid = solve_ladder_cylinder_parallel(w, MAX_COLOR, TIME)
+
+        # Race the backtracker (its own process) against CP-SAT; whichever
+        # settles the width first stops the other
+        native_results = multiprocessing.Queue()
+        native_proc = multiprocessing.Process(
+            target=native_worker, args=(w, MAX_COLOR, NATIVE_NODE_LIMIT, native_results), daemon=True)
+        native_proc.start()
+        result_status, solver, grid, native = solve_ladder_cylinder_parallel(
+            w, MAX_COLOR, TIME, native_results)
+        native_proc.terminate()
+        native_proc.join()
         
         if result_status == cp_model.OPTIMAL or result_status == cp_model.FEASIBLE:
             print(f"SUCCESS!")
@@ -183,6 +363,13 @@ def main():
             for r in range(HEIGHT):
                 print([solver.Value(grid[r, c]) for c in range(w)])
             break 
+        elif native is not None and native[0] == 1:
+            print(f"SUCCESS! (backtracker)")
+            for row in native[1]:
+                print(row)
+            break
+        elif native is not None:
+            print(f"NO SOLUTION (backtracker)")
         else:
             print(f"NO SOLUTION")
 
@@ -12,10 +12,17 @@ def solve_finite_optimized():
     
     # 1. CREATE VARIABLES
     grid = {}
+    b_is_z = {}
     for r in range(N):
         for c in range(N):
             grid[r, c] = model.NewIntVar(1, MAX_COL_NUMBER, f'grid_{r}_{c}')
 
+            # Channeling: b_is_z[r, c, z] is True exactly when grid[r, c] == z
+            z_vars = [model.NewBoolVar(f'is_{z}_{r}_{c}') for z in range(1, MAX_COL_NUMBER + 1)]
+            model.AddMapDomain(grid[r, c], z_vars, offset=1)
+            for z, b in enumerate(z_vars, start=1):
+                b_is_z[r, c, z] = b
+
     print(f"Loading Finite constraints for {N}x{N}...")
     start_time = time.time()
 
@@ -73,10 +80,6 @@ def solve_finite_optimized():
             for c in range(N):
                 u = (r, c)
                 u_index = r * N + c
-                
-                b_is_z = model.NewBoolVar(f'is_{z}_{r}_{c}')
-                model.Add(grid[u] == z).OnlyEnforceIf(b_is_z)
-                model.Add(grid[u] != z).OnlyEnforceIf(b_is_z.Not())
 
                 for v, dist in distances[u].items():
                     if 0 < dist <= z:
@@ -84,7 +87,8 @@ def solve_finite_optimized():
                         
                         # SYMMETRY OPTIMIZATION
                         if v_index > u_index:
-                            model.Add(grid[v] != z).OnlyEnforceIf(b_is_z)
+                            # Pure 2-SAT clause: u and v cannot both be z
+                            model.AddBoolOr([b_is_z[r, c, z].Not(), b_is_z[v[0], v[1], z].Not()])
 
     # ---------------------------------------------------------
     # B. VERTEX ADJACENCY RULES (Finite)
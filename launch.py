@@ -6,7 +6,8 @@ from pathlib import Path
 
 # --- CONFIGURATION ---
 VENV_NAME = ".venv"
-REQUIRED_PACKAGES = ["numpy", "ortools"]
+# Pinned to the versions the scripts are tested with, so pip has nothing to resolve
+REQUIRED_PACKAGES = ["numpy==2.4.6", "numba==0.68.0", "ortools==9.15.6755"]
 # ---------------------
 
 def get_venv_paths(root_dir):
@@ -34,7 +35,16 @@ def create_venv_if_missing(root_dir):
 
 def install_dependencies(venv_python):
     print("--- Verifying dependencies... ---")
-    cmd = [str(venv_python), "-m", "pip", "install"] + REQUIRED_PACKAGES
+    # Importing is much cheaper than a pip round-trip, so only fall back to
+    # pip when something is actually missing
+    modules = ", ".join(pkg.split("==")[0] for pkg in REQUIRED_PACKAGES)
+    probe = subprocess.run([str(venv_python), "-c", f"import {modules}"], capture_output=True)
+    if probe.returncode == 0:
+        print("--- Dependencies already satisfied. ---")
+        return
+
+    cmd = [str(venv_python), "-m", "pip", "install",
+           "--disable-pip-version-check", "--no-input", "--quiet"] + REQUIRED_PACKAGES
     subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
     print("--- Dependencies ready. ---")
 